@@ -14,42 +14,63 @@ Exits non-zero on any step failure.
 """
 import argparse
 import os
+import shutil
 import subprocess
 import sys
 
+from utils.ddl_to_schema import schema_cache_path
 
-def run(cmd, cwd=None):
+# Interpreter for each step. -s skips scanning the per-user site-packages directory at
+# startup; -S/-E are not used because the steps may import orjson from site-packages
+# and must honour PYTHONPATH.
+PYTHON = [sys.executable, "-s"]
+
+def run(cmd, cwd=None, skip_if=None):
+    """Run cmd, exiting on failure. Returns False without running if the skip_if path exists."""
+    if skip_if and os.path.exists(skip_if):
+        print("SKIP:", " ".join(cmd), "(found", skip_if + ")")
+        return False
     print("RUN:", " ".join(cmd))
     res = subprocess.run(cmd, cwd=cwd)
     if res.returncode != 0:
         print("Command failed:", " ".join(cmd), "exitcode=", res.returncode)
         sys.exit(res.returncode)
+    return True
 
 def main():
     p = argparse.ArgumentParser()
-    p.add_argument("sql_file", help="Input .sql dump")
-    p.add_argument("--out-dir", required=True, help="Output folder for registry artifacts")
+    p.add_argument("sql_file", type=os.path.abspath, help="Input .sql dump")
+    p.add_argument("--out-dir", required=True, type=os.path.abspath, help="Output folder for registry artifacts")
     p.add_argument("--ddl-script", default=os.path.join(os.getcwd(),"utils","ddl_to_schema.py"), help="Path to ddl_to_schema.py")
     p.add_argument("--registry-script", default=os.path.join(os.getcwd(),"utils","build_registry.py"), help="path to build_registry.py")
     p.add_argument("--schema-json", default=os.path.join(os.getcwd(),"schema.json"), help="Temporary schema.json path (will be overwritten)")
     p.add_argument("--enrich-script",default=os.path.join(os.getcwd(),"utils","enrich_registry.py"),help="Path to enrich the registry.ndjson")
+    p.add_argument("--no-cache", action="store_true", help="Re-parse the SQL file even if a cached schema exists")
     args = p.parse_args()
 
-    sql_file = os.path.join(os.getcwd(), args.sql_file)
-    out_dir = os.path.join(os.getcwd(), args.out_dir)
+    sql_file = args.sql_file
+    out_dir = args.out_dir
     ddl_script = args.ddl_script
     registry_script = args.registry_script
     enrich_registry = args.enrich_script
-    schema_json = os.path.join(os.getcwd(), out_dir, "schema.json")
+    schema_json = os.path.join(out_dir, "schema.json")
 
     os.makedirs(out_dir, exist_ok=True)
     print(f"Running ddl_to_schema.py from {ddl_script}")
-    # Step 1: run ddl_to_schema.py -> schema.json
-    run([sys.executable, ddl_script, sql_file, schema_json])
+    # Step 1: run ddl_to_schema.py -> schema.json (reuse the cached schema for an unchanged dump)
+    ddl_cmd = [*PYTHON, ddl_script, sql_file, schema_json]
+    cached_schema = None
+    if args.no_cache:
+        ddl_cmd.append("--no-cache")
+    else:
+        with open(sql_file, 'rb') as f:
+            cached_schema = schema_cache_path(f)
+    if not run(ddl_cmd, skip_if=cached_schema):
+        shutil.copy(cached_schema, schema_json)
 
     print(f"Running build_registry.py from {registry_script}")
     # Step 2: run build_registry.py -> registry files in out_dir
-    run([sys.executable, registry_script, schema_json, "--out-dir", out_dir])
+    run([*PYTHON, registry_script, schema_json, "--out-dir", out_dir])
 
     print("Pipeline completed. Outputs saved to:", out_dir)
     print("Files produced (example):")
@@ -62,11 +83,10 @@ def main():
 
     if  files_generated:
         print("Enriching the registry.ndjson to have some sample queries")
-        schema_file = os.path.join(out_dir, "schema.json")
         ndjson_path = os.path.join(out_dir,"registry.ndjson")
         registry_db_path = os.path.join(out_dir,"registry.db")
          # Step 3: run enrich_registry.py -> enriches registry.ndjson file in out_dir
-        run([sys.executable,enrich_registry, "--ndjson_path" ,ndjson_path,"--sqlite_path",registry_db_path,"--schema_path",schema_file])
+        run([*PYTHON, enrich_registry, "--ndjson_path" ,ndjson_path,"--sqlite_path",registry_db_path,"--schema_path",schema_json])
 
 
 if __name__ == "__main__":
@@ -3,57 +3,79 @@
 sql_to_registry.py - Pipeline to convert SQL DDL files to registry format
 
 Usage:
-  python sql_to_registry.py input_dump.sql --out-dir out_folder [--validate]
+  python sql_to_registry.py input_dump.sql --out-dir out_folder [--validate] [--no-cache]
 
-This runs a three-step pipeline:
-  1) ddl_to_schema.py: Extracts CREATE TABLE statements and generates schema.json
-  2) build_registry.py: Creates registry.ndjson and registry.db with table metadata and indexes
-  3) enrich_registry.py: Adds sample queries and additional aliases to the registry
+This runs a three-step pipeline in a single process:
+  1) ddl_to_schema: Extracts CREATE TABLE statements and generates schema.json
+  2) build_registry: Creates registry.ndjson and registry.db with table metadata and indexes
+  3) enrich_registry: Adds sample queries and additional aliases to the registry
+
+The schema is handed from step 1 to the later steps in memory, and steps 2 and 3
+share one SQLite connection. graph_generator.py still runs the standalone
+scripts as subprocesses.
 
 Optional:
   --validate: Test that the generated files can be loaded by TableRegistry
 
+Deprecated (accepted but ignored): --ddl-script, --registry-script, --schema-json, --enrich-script
+
 Exits non-zero on any step failure.
 """
 import argparse
+import json
 import os
-import subprocess
+import sqlite3
 import sys
 
+from utils.build_registry import build_registry
+from utils.ddl_to_schema import load_schema
+from utils.enrich_registry import enrich_registry
 
-def run(cmd, cwd=None):
-    print("RUN:", " ".join(cmd))
-    res = subprocess.run(cmd, cwd=cwd)
-    if res.returncode != 0:
-        print("Command failed:", " ".join(cmd), "exitcode=", res.returncode)
-        sys.exit(res.returncode)
+
+def run_pipeline(sql_path, out_dir, use_cache=True):
+    """Run all pipeline steps in-process. Returns (schema_json, ndjson_path, db_path)."""
+    os.makedirs(out_dir, exist_ok=True)
+    schema_json = os.path.join(out_dir, "schema.json")
+    ndjson_path = os.path.join(out_dir, "registry.ndjson")
+    registry_db_path = os.path.join(out_dir, "registry.db")
+
+    # Step 1: ddl_to_schema -> schema.json
+    print(f"Parsing {sql_path}")
+    schema = load_schema(sql_path, use_cache=use_cache)
+    with open(schema_json, 'w', encoding='utf-8') as f:
+        json.dump(schema, f, indent=2, ensure_ascii=False)
+    print(f"Wrote {len(schema)} tables to {schema_json}")
+
+    conn = sqlite3.connect(registry_db_path)
+    try:
+        # Step 2: build_registry -> registry files in out_dir
+        print(f"Building registry in {out_dir}")
+        build_registry(schema, out_file=ndjson_path, sqlite_file=registry_db_path, conn=conn)
+        # Step 3: enrich_registry -> enriches registry.ndjson file in out_dir
+        print("Enriching the registry.ndjson to have some sample queries")
+        enrich_registry(ndjson_path, registry_db_path, schema_json, conn=conn, schema=schema)
+    finally:
+        conn.close()
+    return schema_json, ndjson_path, registry_db_path
 
 def main():
     p = argparse.ArgumentParser(description="Convert SQL DDL to registry format for LangChain integration")
-    p.add_argument("sql_file", help="Input .sql dump file")
-    p.add_argument("--out-dir", required=True, help="Output folder for registry artifacts")
-    p.add_argument("--ddl-script", default=os.path.join(os.getcwd(),"utils","ddl_to_schema.py"), help="Path to ddl_to_schema.py")
-    p.add_argument("--registry-script", default=os.path.join(os.getcwd(),"utils","build_registry.py"), help="Path to build_registry.py")
-    p.add_argument("--schema-json", default=os.path.join(os.getcwd(),"schema.json"), help="Temporary schema.json path (will be overwritten)")
-    p.add_argument("--enrich-script", default=os.path.join(os.getcwd(),"utils","enrich_registry.py"), help="Path to enrich_registry.py")
+    p.add_argument("sql_file", type=os.path.abspath, help="Input .sql dump file")
+    p.add_argument("--out-dir", required=True, type=os.path.abspath, help="Output folder for registry artifacts")
     p.add_argument("--validate", action="store_true", help="Validate generated files by testing TableRegistry loading")
+    p.add_argument("--no-cache", action="store_true", help="Re-parse the SQL file even if a cached schema exists")
+    # accepted for backward compatibility; the steps now run in-process
+    for opt in ("--ddl-script", "--registry-script", "--schema-json", "--enrich-script"):
+        p.add_argument(opt, help="Deprecated and ignored: the pipeline no longer runs the step scripts")
     args = p.parse_args()
+    deprecated = [opt for opt in ("ddl_script", "registry_script", "schema_json", "enrich_script") if getattr(args, opt) is not None]
+    if deprecated:
+        print("⚠ Ignoring deprecated options:", ", ".join("--" + opt.replace("_", "-") for opt in deprecated))
 
-    sql_file = os.path.join(os.getcwd(), args.sql_file)
-    out_dir = os.path.join(os.getcwd(), args.out_dir)
-    ddl_script = args.ddl_script
-    registry_script = args.registry_script
-    enrich_registry = args.enrich_script
-    schema_json = os.path.join(os.getcwd(), out_dir, "schema.json")
+    sql_file = args.sql_file
+    out_dir = args.out_dir
 
-    os.makedirs(out_dir, exist_ok=True)
-    print(f"Running ddl_to_schema.py from {ddl_script}")
-    # Step 1: run ddl_to_schema.py -> schema.json
-    run([sys.executable, ddl_script, sql_file, schema_json])
-
-    print(f"Running build_registry.py from {registry_script}")
-    # Step 2: run build_registry.py -> registry files in out_dir
-    run([sys.executable, registry_script, schema_json, "--out-dir", out_dir])
+    schema_file, ndjson_path, registry_db_path = run_pipeline(sql_file, out_dir, use_cache=not args.no_cache)
 
     print("Pipeline completed. Outputs saved to:", out_dir)
     print("Files produced (example):")
@@ -65,31 +87,24 @@ def main():
             files_generated = False
 
     if files_generated:
-        print("Enriching the registry.ndjson to have some sample queries")
-        schema_file = os.path.join(out_dir, "schema.json")
-        ndjson_path = os.path.join(out_dir, "registry.ndjson")
-        registry_db_path = os.path.join(out_dir, "registry.db")
-        # Step 3: run enrich_registry.py -> enriches registry.ndjson file in out_dir
-        run([sys.executable, enrich_registry, "--ndjson_path", ndjson_path, "--sqlite_path", registry_db_path, "--schema_path", schema_file])
-        
         # Optional validation step
         if args.validate:
             print("\nValidating generated files...")
             try:
                 # Import here to avoid requiring it for basic pipeline
                 from utils.table_selector import TableRegistry
-                
+
                 registry = TableRegistry(ndjson_path, registry_db_path, schema_path=schema_file)
                 table_count = len(registry.tables)
                 print(f"✓ Successfully loaded registry with {table_count} tables")
-                
+
                 # Test a simple query
                 test_tables = registry.find_tables_by_token("policy", limit=1)
                 if test_tables:
                     print(f"✓ Test query successful: found {len(test_tables)} table(s) for token 'policy'")
                 else:
                     print("⚠ Test query returned no results (this may be normal if no matching tables exist)")
-                
+
                 registry.close()
                 print("✓ Validation passed!")
             except ImportError as e:
@@ -98,7 +113,7 @@ def main():
                 print(f"✗ Validation failed: {e}")
                 # Don't fail the pipeline on validation errors
     else:
-        print("⚠ Some files were not generated. Skipping enrichment step.")
+        print("⚠ Some generated files are missing.")
         sys.exit(1)
 
 
@@ -4,15 +4,34 @@ ddl_to_schema_robust.py
 Produce a simple schema.json mapping table -> [column,...] from a SQL dump.
 
 Usage:
-    python ddl_to_schema_robust.py input_dump.sql schema.json
+    python ddl_to_schema_robust.py input_dump.sql schema.json [--no-cache]
+
+Parsed schemas are cached under ~/.cache/sql2graph (override with
+SQL2GRAPH_CACHE_DIR), keyed by a hash of the input bytes and PARSER_VERSION.
 """
 
+import hashlib
 import json
+import mmap
+import multiprocessing
+import os
 import re
 import sys
-from typing import Dict, List
+from contextlib import nullcontext
+from typing import BinaryIO, Dict, List, Tuple
+
+# bump when parsing changes so stale cache entries are not reused
+PARSER_VERSION = "2"
+CACHE_DIR = os.getenv("SQL2GRAPH_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "sql2graph"))
 
-import sqlparse
+_CREATE_RE = re.compile(rb'create\s+table', re.I)
+_PAREN_RE = re.compile(rb'[()]')
+_CREATE_TABLE_RE = re.compile(r'create\s+table\s+([A-Za-z0-9_\.[\[\]"]+)\s*$', re.I)
+_CONSTRAINT_RE = re.compile(r'^(constraint|primary\s+key|unique|foreign\s+key|check|index|alter|constraint)', re.I)
+_DELIM_RE = re.compile(r"[,()\[\]'\"]")
+_BARE_ID_RE = re.compile(r'[A-Za-z0-9_]+')
+# opening character of a delimited column name -> closing character
+_NAME_CLOSERS = {'[': ']', '"': '"', '`': '`'}
 
 # Helpers ---------------------------------------------------------
 def strip_brackets_and_quotes(name: str) -> str:
@@ -49,31 +68,30 @@ def strip_brackets_and_quotes(name: str) -> str:
 
     return s.strip()
 
-def find_create_table_blocks(sql_text: str) -> List[Dict[str,str]]:
+def find_create_table_blocks(buf: bytes) -> List[Dict[str,str]]:
     """
     Return list of dicts: {"table": raw_table_identifier, "cols_block": text_inside_parentheses}
     Uses a scanning approach to find 'CREATE TABLE' and the matching parentheses block.
+    buf is the raw dump as bytes or an mmap; only the table name and column
+    block of each match are decoded to str.
     """
     blocks = []
-    # Normalize whitespace for keyword search but keep original for extraction
-    lower = sql_text.lower()
     idx = 0
     while True:
-        pos = lower.find('create table', idx)
-        if pos == -1:
+        m = _CREATE_RE.search(buf, idx)
+        if not m:
             break
-        # move to the original position in sql_text
-        start = pos
+        pos = m.start()
         # find the opening parenthesis after the table name
         # we search forward from pos to find the first '(' that starts the column list
-        open_paren_pos = sql_text.find('(', pos)
+        open_paren_pos = buf.find(b'(', pos)
         if open_paren_pos == -1:
-            idx = pos + 12
+            idx = m.end()
             continue
         # backtrack from open_paren_pos to capture the table identifier
-        pre = sql_text[pos:open_paren_pos]
+        pre = buf[pos:open_paren_pos].decode('utf-8', errors='ignore')
         # try to extract the table name from 'CREATE TABLE <name>' (allowing optional schema and brackets)
-        m = re.search(r'create\s+table\s+([A-Za-z0-9_\.[\[\]"]+)\s*$', pre, flags=re.I)
+        m = _CREATE_TABLE_RE.search(pre)
         if not m:
             # fallback: take the token immediately before '('
             token = pre.strip().split()[-1] if pre.strip().split() else None
@@ -81,25 +99,21 @@ def find_create_table_blocks(sql_text: str) -> List[Dict[str,str]]:
         else:
             raw_table = m.group(1)
         # now scan forward to find the matching closing parenthesis, handling nested parentheses
-        i = open_paren_pos
         depth = 0
         end_pos = None
-        L = len(sql_text)
-        while i < L:
-            ch = sql_text[i]
-            if ch == '(':
+        for pm in _PAREN_RE.finditer(buf, open_paren_pos):
+            if pm.group() == b'(':
                 depth += 1
-            elif ch == ')':
+            else:
                 depth -= 1
                 if depth == 0:
-                    end_pos = i
+                    end_pos = pm.start()
                     break
-            i += 1
         if end_pos is None:
             # no matching close paren found; skip this occurrence
             idx = pos + 12
             continue
-        cols_block = sql_text[open_paren_pos+1:end_pos]
+        cols_block = buf[open_paren_pos+1:end_pos].decode('utf-8', errors='ignore')
         blocks.append({"table_raw": raw_table, "cols_block": cols_block})
         idx = end_pos + 1
     return blocks
@@ -108,48 +122,38 @@ def split_top_level_commas(s: str) -> List[str]:
     """
     Split string s by commas that are at top-level (not inside parentheses or brackets or quotes).
     Returns list of parts (trimmed).
+    Jumps between delimiter characters instead of walking every character;
+    text between delimiters is kept verbatim, so each part is a slice of s.
     """
     parts = []
-    cur = []
+    start = 0
     depth = 0
     in_sq = False
     in_dq = False
     in_br = False
-    i = 0
-    while i < len(s):
-        ch = s[i]
-        # handle escapes inside quotes for safety
+    for m in _DELIM_RE.finditer(s):
+        ch = m.group()
         if ch == "'" and not in_dq and not in_br:
             in_sq = not in_sq
-            cur.append(ch)
         elif ch == '"' and not in_sq and not in_br:
             in_dq = not in_dq
-            cur.append(ch)
         elif ch == '[' and not in_sq and not in_dq:
             in_br = True
-            cur.append(ch)
         elif ch == ']' and in_br:
             in_br = False
-            cur.append(ch)
         elif in_sq or in_dq or in_br:
-            cur.append(ch)
-        else:
-            if ch == '(':
-                depth += 1
-                cur.append(ch)
-            elif ch == ')':
-                if depth > 0:
-                    depth -= 1
-                cur.append(ch)
-            elif ch == ',' and depth == 0:
-                part = ''.join(cur).strip()
-                if part:
-                    parts.append(part)
-                cur = []
-            else:
-                cur.append(ch)
-        i += 1
-    last = ''.join(cur).strip()
+            continue
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            if depth > 0:
+                depth -= 1
+        elif ch == ',' and depth == 0:
+            part = s[start:m.start()].strip()
+            if part:
+                parts.append(part)
+            start = m.end()
+    last = s[start:].strip()
     if last:
         parts.append(last)
     return parts
@@ -165,42 +169,101 @@ def parse_column_name_from_def(col_def: str) -> str:
     """
     s = col_def.strip()
     # ignore table-level constraints
-    if re.match(r'^(constraint|primary\s+key|unique|foreign\s+key|check|index|alter|constraint)', s, flags=re.I):
+    if _CONSTRAINT_RE.match(s):
         return ""
     # remove trailing commas if any
     if s.endswith(','):
         s = s[:-1].strip()
     # column name is the first token, but may be bracketed or quoted
-    # match bracketed or quoted or bare identifier
-    m = re.match(r'^\s*(?:\[(?P<b>[^\]]+)\]|"(?P<q>[^"]+)"|`(?P<bt>[^`]+)`|(?P<id>[A-Za-z0-9_]+))', s)
+    # dispatch on the first character: bracketed, quoted, backticked or bare identifier
+    name = None
+    c = s[:1]
+    if c in _NAME_CLOSERS:
+        end = s.find(_NAME_CLOSERS[c], 1)
+        if end > 1:
+            name = s[1:end]
+    else:
+        m = _BARE_ID_RE.match(s)
+        if m:
+            name = m.group()
 
-    if not m:
+    if name is None:
         # fallback: split by whitespace
         toks = s.split()
         return strip_brackets_and_quotes(toks[0]) if toks else ""
-    name = m.group('b') or m.group('q') or m.group('bt') or m.group('id')
     return strip_brackets_and_quotes(name)
 
 # Main ------------------------------------------------------------
-def ddl_to_schema(sql_text: str) -> Dict[str, List[str]]:
+# parse blocks in a process pool when SQL2GRAPH_PARALLEL is 1/true/yes and the dump is large enough
+PARALLEL_MIN_BLOCKS = 64
+
+def _parallel_enabled() -> bool:
+    return os.getenv("SQL2GRAPH_PARALLEL", "").strip().lower() in ("1", "true", "yes")
+
+def _parse_block(blk: Dict[str, str]) -> Tuple[str, List[str]]:
+    """Return (table, columns) for one CREATE TABLE block. Module-level so it can be pickled."""
+    table = strip_brackets_and_quotes(blk['table_raw'])
+    # split into top-level comma-separated column/constraint definitions
+    parts = split_top_level_commas(blk['cols_block'])
+    cols = []
+    seen = set()
+    for p in parts:
+        colname = parse_column_name_from_def(p)
+        if colname and colname not in seen:
+            seen.add(colname)
+            cols.append(colname)
+    return table, cols
+
+def ddl_to_schema(sql_text) -> Dict[str, List[str]]:
+    # accepts str, bytes or an mmap of the dump
+    if isinstance(sql_text, str):
+        sql_text = sql_text.encode('utf-8')
     tables = {}
     blocks = find_create_table_blocks(sql_text)
-    for blk in blocks:
-        raw_table = blk['table_raw']
-        table = strip_brackets_and_quotes(raw_table)
-        cols_block = blk['cols_block']
-        # split into top-level comma-separated column/constraint definitions
-        parts = split_top_level_commas(cols_block)
-        cols = []
-        for p in parts:
-            colname = parse_column_name_from_def(p)
-            if colname:
-                if colname not in cols:
-                    cols.append(colname)
+    if len(blocks) > PARALLEL_MIN_BLOCKS and _parallel_enabled():
+        # imap keeps block order so the result matches the serial path
+        with multiprocessing.Pool(os.cpu_count()) as pool:
+            parsed = list(pool.imap(_parse_block, blocks, chunksize=32))
+    else:
+        parsed = map(_parse_block, blocks)
+    for table, cols in parsed:
         if cols:
             tables[table] = cols
     return tables
 
+# Cache -----------------------------------------------------------
+def schema_cache_path(f: BinaryIO) -> str:
+    """Return the cache file path for the SQL dump open in binary mode as f (read from its current position)."""
+    # file_digest hashes in chunks, so the dump is never held in memory
+    h = hashlib.file_digest(f, lambda: hashlib.sha1(PARSER_VERSION.encode()))
+    return os.path.join(CACHE_DIR, f"schema-{h.hexdigest()}.json")
+
+def load_schema(in_file: str, use_cache: bool = True) -> Dict[str, List[str]]:
+    """
+    Parse the SQL dump at in_file into {table: [column,...]}.
+    Returns the cached schema for unchanged input unless use_cache is False;
+    a fresh parse always refreshes the cache.
+    """
+    with open(in_file, 'rb') as f:
+        cache_file = schema_cache_path(f)
+        if use_cache and os.path.exists(cache_file):
+            print(f"Schema cache hit: {cache_file}")
+            with open(cache_file, 'r', encoding='utf-8') as cf:
+                return json.load(cf)
+        # map the dump instead of reading it into memory (empty files cannot be mapped)
+        with (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+              if os.fstat(f.fileno()).st_size else nullcontext(b"")) as buf:
+            schema = ddl_to_schema(buf)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = cache_file + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as cf:
+            json.dump(schema, cf, indent=2, ensure_ascii=False)
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        print(f"Could not write schema cache {cache_file}: {e}")
+    return schema
+
 # CLI -------------------------------------------------------------
 def main():
 
@@ -208,15 +271,12 @@ def main():
     p = argparse.ArgumentParser()
     p.add_argument("in_file", help="Path to input .sql dump")
     p.add_argument("out_file", help="Path to output schema.json")
+    p.add_argument("--no-cache", action="store_true", help="Force a re-parse even if a cached schema exists")
     args = p.parse_args()
     in_file = args.in_file
     out_file = args.out_file
     print(f"Reading {in_file} and writing to {out_file}")
-    with open(in_file, 'r', encoding='utf-8', errors='ignore') as f:
-        sql_text = f.read()
-    # optional: remove common noise like GO lines to simplify scanning
-    # but keep them for sqlparse; we already handle GO in scanning
-    schema = ddl_to_schema(sql_text)
+    schema = load_schema(in_file, use_cache=not args.no_cache)
     print(f"Writing {len(schema)} tables to {out_file}")
     with open(out_file, 'w', encoding='utf-8') as f:
         json.dump(schema, f, indent=2, ensure_ascii=False)
@@ -2,18 +2,35 @@
 import json
 import os
 import re
+import shutil
 import sqlite3
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Tuple
 
+try:
+    import orjson
 
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+    _loads = orjson.loads
+except ImportError:
+    # orjson is optional; fall back to the stdlib codec
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf8')
+    _loads = json.loads
+
+# column and table name parts repeat heavily across tables, so the token helpers are memoized
+@lru_cache(maxsize=8192)
 def normalize_token(s: str) -> str:
     return re.sub(r'[^0-9a-z]', '_', s.lower()).strip('_')
 
-def split_col_tokens(col: str) -> List[str]:
+@lru_cache(maxsize=8192)
+def split_col_tokens(col: str) -> Tuple[str, ...]:
     # split snake/camel and remove common suffixes
     s = re.sub(r'(_id|_no|id|no)$', '', col, flags=re.I)
     parts = re.split(r'[_\s]+', s)
-    return [normalize_token(p) for p in parts if p]
+    return tuple(normalize_token(p) for p in parts if p)
 
 def make_templates(table: str, top_cols: List[str]) -> List[str]:
     # choose likely pk and date columns heuristically
@@ -31,70 +48,114 @@ def make_templates(table: str, top_cols: List[str]) -> List[str]:
     templates.append(f"Show details for {table} for Hindustan Petroleum")
     return templates
 
-def enrich_registry(ndjson_path, sqlite_path, schema_path)->(str,str,str):
-    backup_dir = os.path.join(os.getcwd(),"backup")
-    os.makedirs(backup_dir, exist_ok=True)
-    BACKUP = os.path.join(backup_dir,"registry.ndjson.bak")
+def _tune(conn):
+    # the registry db is rebuilt from the dump, so trade durability for bulk-insert speed
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-200000")
+
+def ensure_unique_indexes(cur):
+    """
+    Add UNIQUE indexes on alias_index/column_index so INSERT OR IGNORE skips duplicates.
+    Registries built before these indexes existed can hold duplicate rows; those are
+    removed once, before the index is created.
+    """
+    for index, table, cols in (("ux_alias", "alias_index", "token, table_name"),
+                               ("ux_col", "column_index", "token, table_name, column_name")):
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name=?", (index,))
+        if cur.fetchone():
+            continue
+        cur.execute(f"DELETE FROM {table} WHERE rowid NOT IN (SELECT MIN(rowid) FROM {table} GROUP BY {cols})")
+        cur.execute(f"CREATE UNIQUE INDEX {index} ON {table}({cols})")
+
+def enrich_registry(ndjson_path, sqlite_path, schema_path, conn=None, schema=None, backup=False)->(str,str,str):
+    # conn: optional open connection to sqlite_path, left open for the caller
+    # schema: optional already-loaded schema dict, skips reading schema_path
+    # backup: copy the original registry.ndjson to ./backup/registry.ndjson.bak first
     
     # load schema (optional)
-    schema = {}
-    if os.path.exists(schema_path):
-        with open(schema_path, 'r', encoding='utf8') as f:
-            schema = json.load(f)
+    if schema is None:
+        schema = {}
+        if os.path.exists(schema_path):
+            with open(schema_path, 'r', encoding='utf8') as f:
+                schema = json.load(f)
 
-    # backup ndjson
     if not os.path.exists(ndjson_path):
         raise FileNotFoundError(f"Registry file not found: {ndjson_path}")
-    
-    # Create backup by moving the original file
-    os.replace(ndjson_path, BACKUP)
+
+    # backup ndjson in the background; it only has to finish before the file is rewritten
+    backup_future = None
+    if backup:
+        backup_dir = os.path.join(os.getcwd(),"backup")
+        os.makedirs(backup_dir, exist_ok=True)
+        BACKUP = os.path.join(backup_dir,"registry.ndjson.bak")
+        pool = ThreadPoolExecutor(max_workers=1)
+        backup_future = pool.submit(shutil.copyfile, ndjson_path, BACKUP)
+        pool.shutdown(wait=False)  # no more tasks; the copy keeps running
+
+    # read all docs once; they are enriched in memory and written back at the end.
+    # The Streamlit app appends updated docs, so keep the last line per table (at its
+    # first position); the rewrite below also compacts the file.
+    docs = {}
+    with open(ndjson_path, 'rb') as f:
+        for line in f:
+            if len(line) <= 1:  # blank line
+                continue
+            doc = _loads(line)
+            docs[doc.get("table")] = doc
+    docs = list(docs.values())
 
     # open sqlite
-    conn = sqlite3.connect(sqlite_path)
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(sqlite_path)
+    _tune(conn)
     cur = conn.cursor()
+    conn.execute("BEGIN")
+    ensure_unique_indexes(cur)
+    alias_rows = []
+    col_rows = []
+
+    for doc in docs:
+        table = doc.get("table")
+        top_cols = doc.get("top_columns", [])
+        # if sample_queries empty, generate templates
+        if not doc.get("sample_queries"):
+            doc["sample_queries"] = make_templates(table, top_cols)
+        # generate simple synonyms from table name and top columns
+        aliases = set(doc.get("aliases", []))
+        aliases.add(normalize_token(table))
+        aliases.update(normalize_token(part) for part in table.split('_'))
+        aliases.update(tok for c in top_cols for tok in split_col_tokens(c))
+        # add insurer/company tokens heuristically
+        if any('insur' in c.lower() for c in top_cols):
+            aliases.add('insurer')
+            aliases.add('insurance')
+        doc["aliases"] = sorted(aliases)
+
+        # collect alias_index rows for new aliases
+        alias_rows.extend((a, table) for a in doc["aliases"])
+        # also collect column tokens
+        col_rows.extend((tok, table, c) for c in schema.get(table, top_cols) for tok in split_col_tokens(c))
 
-    # read backup and write new ndjson
-    with open(BACKUP, 'r', encoding='utf8') as fin, open(ndjson_path, 'w', encoding='utf8') as fout:
-        for line in fin:
-            doc = json.loads(line)
-            table = doc.get("table")
-            top_cols = doc.get("top_columns", [])
-            # if sample_queries empty, generate templates
-            if not doc.get("sample_queries"):
-                doc["sample_queries"] = make_templates(table, top_cols)
-            # generate simple synonyms from table name and top columns
-            aliases = set(doc.get("aliases", []))
-            aliases.add(normalize_token(table))
-            for part in table.split('_'):
-                aliases.add(normalize_token(part))
-            for c in top_cols:
-                for tok in split_col_tokens(c):
-                    aliases.add(tok)
-            # add insurer/company tokens heuristically
-            if any('insur' in c.lower() for c in top_cols):
-                aliases.add('insurer')
-                aliases.add('insurance')
-            doc["aliases"] = list(sorted(aliases))
-
-            # write updated doc
-            fout.write(json.dumps(doc, ensure_ascii=False) + "\n")
-
-            # update sqlite alias_index for new aliases (idempotent insert)
-            for a in doc["aliases"]:
-                try:
-                    cur.execute("INSERT INTO alias_index(token, table_name) VALUES (?,?)", (a, table))
-                except Exception:
-                    pass
-            # also insert column tokens
-            for c in schema.get(table, top_cols):
-                for tok in split_col_tokens(c):
-                    try:
-                        cur.execute("INSERT INTO column_index(token, table_name, column_name) VALUES (?,?,?)", (tok, table, c))
-                    except Exception:
-                        pass
+    # write updated docs
+    if backup_future is not None:
+        # re-raises a failed copy here, before the original is replaced
+        backup_future.result()
+    # write to a temp file and swap it in, so a failed write never truncates the registry
+    tmp = ndjson_path + ".tmp"
+    with open(tmp, 'wb') as f:
+        if docs:
+            f.write(b"\n".join(_dumps(d) for d in docs) + b"\n")
+    os.replace(tmp, ndjson_path)
 
+    # update sqlite indexes in a single batch (idempotent insert)
+    cur.executemany("INSERT OR IGNORE INTO alias_index(token, table_name) VALUES (?,?)", alias_rows)
+    cur.executemany("INSERT OR IGNORE INTO column_index(token, table_name, column_name) VALUES (?,?,?)", col_rows)
     conn.commit()
-    conn.close()
+    if own_conn:
+        conn.close()
     print("Enrichment complete. Wrote:", ndjson_path)
 
 if __name__ == "__main__":
@@ -103,6 +164,7 @@ if __name__ == "__main__":
     p.add_argument("--ndjson_path", required=True, help="Path to registry.ndjson")
     p.add_argument("--sqlite_path", required=True, help="Path to registry.db")
     p.add_argument("--schema_path", required=True, help="Path to schema.json")
+    p.add_argument("--backup", action="store_true", help="Copy registry.ndjson to ./backup/registry.ndjson.bak before rewriting it")
     args = p.parse_args()
     ndjson_path = args.ndjson_path
     sqlite_path = args.sqlite_path
@@ -110,4 +172,4 @@ if __name__ == "__main__":
     print(f"ndjson_path {ndjson_path} and it exists: {os.path.exists(ndjson_path)}")
     print(f"sqlite_path {sqlite_path} and it exists : {os.path.exists(sqlite_path)}")
     print(f"schema_path {schema_path} and it exists : {os.path.exists(schema_path)}")
-    enrich_registry(ndjson_path,sqlite_path,schema_path)
+    enrich_registry(ndjson_path,sqlite_path,schema_path,backup=args.backup)
@@ -1,5 +1,10 @@
 import re
 
+_WEBSITE_WRAP_RE = re.compile(r'<WebsiteContent_[^>]*>(.*?)</WebsiteContent_[^>]*>', re.DOTALL | re.IGNORECASE)
+_WEBSITE_TAG_RE = re.compile(r'</?WebsiteContent_[^>]*>', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]+>')
+_WS_RE = re.compile(r'\s+')
+
 def sanitize_page_field(s: str, maxlen: int = 200) -> str:
     """
     Clean pageTitle / pageUrl values that may be wrapped in
@@ -11,18 +16,20 @@ def sanitize_page_field(s: str, maxlen: int = 200) -> str:
         return ""
     s = str(s)
 
-    # 1) Extract inner text for WebsiteContent wrappers (non-greedy)
-    #    e.g. "<WebsiteContent_M...>inner</WebsiteContent_M...>" -> "inner"
-    s = re.sub(r'<WebsiteContent_[^>]*>(.*?)</WebsiteContent_[^>]*>', r'\1', s, flags=re.DOTALL|re.IGNORECASE)
+    # Steps 1-3 only apply to tagged values; plain strings skip straight to step 4
+    if '<' in s:
+        # 1) Extract inner text for WebsiteContent wrappers (non-greedy)
+        #    e.g. "<WebsiteContent_M...>inner</WebsiteContent_M...>" -> "inner"
+        s = _WEBSITE_WRAP_RE.sub(r'\1', s)
 
-    # 2) Remove any remaining single tags like <WebsiteContent_...> or </WebsiteContent_...>
-    s = re.sub(r'</?WebsiteContent_[^>]*>', '', s, flags=re.IGNORECASE)
+        # 2) Remove any remaining single tags like <WebsiteContent_...> or </WebsiteContent_...>
+        s = _WEBSITE_TAG_RE.sub('', s)
 
-    # 3) Remove any other angle-bracket tags (generic HTML/XML)
-    s = re.sub(r'<[^>]+>', '', s)
+        # 3) Remove any other angle-bracket tags (generic HTML/XML)
+        s = _TAG_RE.sub('', s)
 
     # 4) Collapse whitespace and trim
-    s = re.sub(r'\s+', ' ', s).strip()
+    s = _WS_RE.sub(' ', s).strip()
 
     # 5) Optional: if the result is just a URL or empty, return empty to avoid using it as a table name
     low = s.lower()
@@ -1,32 +1,61 @@
 # streamlit_enrich.py
+import heapq
+import itertools
 import json
 import os
 import re
 import sqlite3
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 import streamlit as st
 
+from enrich_registry import ensure_unique_indexes
+from table_selector import TableRegistry, iter_ndjson
+
+try:
+    import orjson
+
+    def _dumpline(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    _loads = orjson.loads
+except ImportError:
+    # orjson is optional; fall back to the stdlib codec
+    def _dumpline(obj) -> bytes:
+        return (json.dumps(obj, ensure_ascii=False) + "\n").encode('utf8')
+    _loads = json.loads
+
 # ---------- Configuration ----------
 SCRIPT_DIR = Path(__file__).parent.resolve()
 PROJECT_ROOT = SCRIPT_DIR.parent
 OUT_DIR = os.getenv("REGISTRY_OUT_DIR", str(PROJECT_ROOT / "out"))
 
+_NONALNUM = re.compile(r'[^0-9a-z]')
+_TOK = re.compile(r'[0-9a-z]+')
+_TAG = re.compile(r'<[^>]+>')
+_WS = re.compile(r'\s+')
+# table.column references; groups capture both parts in the same pass
+_DOTREF = re.compile(r'([A-Za-z0-9_]+)\.([A-Za-z0-9_]+)')
+
 # ---------- Utility functions ----------
 def normalize_token(s: str) -> str:
-    return re.sub(r'[^0-9a-z]', '_', s.lower()).strip('_')
+    return _NONALNUM.sub('_', s.lower()).strip('_')
 
 def tokenize_text(s: str) -> List[str]:
-    return list({t for t in re.sub(r'[^0-9a-z]', ' ', s.lower()).split() if t})
+    # one regex pass; dict.fromkeys dedupes while keeping first-seen order
+    return list(dict.fromkeys(_TOK.findall(s.lower())))
 
 def sanitize_text(s: str, maxlen: int = 200) -> str:
     if s is None:
         return ""
     if not isinstance(s, str):
         s = str(s)
-    s = re.sub(r'<[^>]+>', '', s)            # remove angle-bracket tags
-    s = re.sub(r'\s+', ' ', s).strip()       # collapse whitespace
+    # already clean: no tags, and the only whitespace is single inner spaces
+    # (isprintable() rejects every whitespace character except ' ')
+    if '<' not in s and '  ' not in s and s.isprintable() and s[:1] != ' ' and s[-1:] != ' ':
+        return s[:maxlen]
+    s = _TAG.sub('', s)                      # remove angle-bracket tags
+    s = _WS.sub(' ', s).strip()              # collapse whitespace
     return s[:maxlen]
 
 def get_paths(out_dir: str = None):
@@ -40,19 +69,34 @@ def get_paths(out_dir: str = None):
 
 # ---------- File I/O (cached) ----------
 @st.cache_data
-def load_docs_cached(path: str) -> List[Dict]:
-    docs = []
+def _load_ndjson(path: str) -> Tuple[Dict[str, Dict], int]:
+    # returns ({table: doc}, number of non-blank lines); the line count tells saves when to compact
+    # saves append updated docs, so the last line for a table wins (keeping its first position)
+    docs = {}
+    lines = 0
     if not os.path.exists(path):
-        return docs
-    with open(path, 'r', encoding='utf8') as f:
-        for line in f:
-            if line.strip():
-                try:
-                    docs.append(json.loads(line))
-                except Exception:
-                    # skip malformed lines
-                    continue
-    return docs
+        return {}, 0
+    for line in iter_ndjson(path):
+        lines += 1
+        try:
+            d = _loads(line)
+        except Exception:
+            # skip malformed lines
+            continue
+        docs[d.get("table")] = d
+    return docs, lines
+
+def load_docs_cached(path: str) -> List[Dict]:
+    return list(_load_ndjson(path)[0].values())
+
+def load_docs_by_table(path: str) -> Dict[str, Dict]:
+    return _load_ndjson(path)[0]
+
+@st.cache_data
+def get_tables_and_lower(path: str) -> Tuple[List[str], List[str]]:
+    # table names plus their lowercased forms for the search box, computed once per file
+    names = list(load_docs_by_table(path))
+    return names, [n.lower() for n in names]
 
 @st.cache_data
 def load_schema_cached(path: str) -> Dict:
@@ -64,31 +108,67 @@ def load_schema_cached(path: str) -> Dict:
         except Exception:
             return {}
 
+@st.cache_resource
+def _get_conn(db_path: str) -> sqlite3.Connection:
+    # one connection per db for the app's lifetime; reruns execute on different threads
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # one-shot migration: UNIQUE indexes let INSERT OR IGNORE drop repeated rows.
+    # The index tables are created first (as build_registry does) so a db without them
+    # still accepts saves.
+    with conn:
+        cur = conn.cursor()
+        cur.execute("CREATE TABLE IF NOT EXISTS alias_index(token TEXT, table_name TEXT)")
+        cur.execute("CREATE TABLE IF NOT EXISTS column_index(token TEXT, table_name TEXT, column_name TEXT)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_alias ON alias_index(token)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_col ON column_index(token)")
+        ensure_unique_indexes(cur)
+    return conn
+
+@st.cache_resource
+def get_registry(ndjson: str, db: str, schema: str) -> TableRegistry:
+    # loaded once per process instead of on every rerun; cleared after saves
+    return TableRegistry(ndjson, db, schema_path=schema if os.path.exists(schema) else None)
+
 def save_docs(path: str, docs: List[Dict]):
     tmp = path + ".tmp"
-    with open(tmp, 'w', encoding='utf8') as f:
+    with open(tmp, 'wb') as f:
         for d in docs:
-            f.write(json.dumps(d, ensure_ascii=False) + "\n")
+            f.write(_dumpline(d))
     os.replace(tmp, path)
 
+def append_doc(path: str, doc: Dict):
+    # append one updated doc; _load_ndjson lets it supersede earlier lines for the same table
+    with open(path, 'a+b') as f:
+        # a file without a trailing newline would glue the doc onto its last line
+        if f.seek(0, os.SEEK_END):
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+        f.write(_dumpline(doc))
+
+def _compaction_due(lines: int, live: int) -> bool:
+    # rewrite the file once superseded lines make up more than half of it
+    return lines > 2 * live
+
 def upsert_sample_query(ndjson_path: str, sqlite_path: str, table: str, sample_obj):
-    docs = load_docs_cached(ndjson_path)
-    # convert cached list to mutable copy
-    docs = list(docs)
-    found = False
-    for d in docs:
-        if d.get("table") == table:
-            found = True
-            sq = d.get("sample_queries") or []
-            if sample_obj not in sq:
-                sq.append(sample_obj)
-            d["sample_queries"] = sq
-            aliases = set(d.get("aliases", []))
-            aliases.add(normalize_token(table))
-            d["aliases"] = list(sorted(aliases))
-            break
-    if not found:
-        docs.append({
+    # cache_data hands out a copy, so docs can be updated in place
+    docs, lines = _load_ndjson(ndjson_path)
+    d = docs.get(table)
+    if d is not None:
+        sq = d.get("sample_queries") or []
+        if sample_obj not in sq:
+            sq.append(sample_obj)
+        d["sample_queries"] = sq
+        # aliases stay in insertion order; only the table's own token is ever added
+        aliases = d.get("aliases") or []
+        norm = normalize_token(table)
+        if norm not in aliases:
+            aliases.append(norm)
+        d["aliases"] = aliases
+    else:
+        d = {
             "table": table,
             "sig": f"tbl:{table}|h:manual",
             "top_columns": [],
@@ -96,43 +176,38 @@ def upsert_sample_query(ndjson_path: str, sqlite_path: str, table: str, sample_o
             "sample_queries": [sample_obj],
             "neighbors": [],
             "sensitivity": "low"
-        })
-    # backup and save
-    if os.path.exists(ndjson_path):
-        os.replace(ndjson_path, ndjson_path + ".bak")
-    save_docs(ndjson_path, docs)
-
-    # update sqlite indexes
-    conn = sqlite3.connect(sqlite_path)
-    cur = conn.cursor()
+        }
+        docs[table] = d
+    # counts as they will be after this save appends one line
+    if _compaction_due(lines + 1, len(docs)):
+        # backup and rewrite the whole file
+        if os.path.exists(ndjson_path):
+            os.replace(ndjson_path, ndjson_path + ".bak")
+        save_docs(ndjson_path, list(docs.values()))
+    else:
+        append_doc(ndjson_path, d)
+
+    # update sqlite indexes: collect unique rows, then insert them in one transaction
     qtext = sample_obj['query'] if isinstance(sample_obj, dict) else str(sample_obj)
-    for t in tokenize_text(qtext):
-        try:
-            cur.execute("INSERT INTO alias_index(token, table_name) VALUES (?,?)", (t, table))
-        except Exception:
-            pass
+    alias_rows = {(t, table) for t in tokenize_text(qtext)}
+    col_rows = set()
     if isinstance(sample_obj, dict):
         for j in sample_obj.get("joins", []):
             jt = j.get("table")
             if jt:
-                for t in tokenize_text(jt):
-                    try:
-                        cur.execute("INSERT INTO alias_index(token, table_name) VALUES (?,?)", (t, jt))
-                    except Exception:
-                        pass
+                alias_rows.update((t, jt) for t in tokenize_text(jt))
             on = j.get("on", "")
-            for tok in re.findall(r'[A-Za-z0-9_]+\.[A-Za-z0-9_]+', on):
-                tbl, col = tok.split('.', 1)
-                try:
-                    cur.execute("INSERT INTO column_index(token, table_name, column_name) VALUES (?,?,?)",
-                                (normalize_token(col), tbl, col))
-                except Exception:
-                    pass
-    conn.commit()
-    conn.close()
+            col_rows.update((normalize_token(col), tbl, col) for tbl, col in _DOTREF.findall(on))
+    conn = _get_conn(sqlite_path)
+    with conn:
+        cur = conn.cursor()
+        cur.executemany("INSERT OR IGNORE INTO alias_index(token, table_name) VALUES (?,?)", list(alias_rows))
+        cur.executemany("INSERT OR IGNORE INTO column_index(token, table_name, column_name) VALUES (?,?,?)", list(col_rows))
     # clear caches so UI reloads updated content
-    load_docs_cached.clear()
+    _load_ndjson.clear()
+    get_tables_and_lower.clear()
     load_schema_cached.clear()
+    get_registry.clear()
 
 # ---------- Path helpers and session init ----------
 from pathlib import Path as _Path
@@ -191,8 +266,8 @@ DB = paths['db']
 SCHEMA = paths['schema']
 
 # Load docs and schema (cached)
-docs = load_docs_cached(NDJSON)
-tables = [d['table'] for d in docs]
+docs_by_table = load_docs_by_table(NDJSON)
+tables, tables_lower = get_tables_and_lower(NDJSON)
 schema = load_schema_cached(SCHEMA)
 
 # Out Dir + Refresh UI (main area)
@@ -229,9 +304,10 @@ with col1:
     # searchable selection to handle many tables
     search_q = st.text_input("Find table (type substring)", key="table_search")
     if search_q:
-        candidates = [t for t in tables if search_q.lower() in t.lower()][:200]
+        needle = search_q.lower()
+        candidates = list(itertools.islice((t for t, tl in zip(tables, tables_lower) if needle in tl), 200))
     else:
-        candidates = sorted(tables)[:200]
+        candidates = heapq.nsmallest(200, tables)
     table = st.selectbox("Table", options=candidates or ["<no tables found>"], key="table_select")
     st.markdown("Or enter a new table name to create a minimal doc")
     new_table = st.text_input("New table name", value="", key="new_table_input")
@@ -292,8 +368,8 @@ with col1:
 
 with col2:
     st.subheader("Table Doc Preview")
-    if table and docs:
-        doc = next((d for d in docs if d['table'] == table), None)
+    if table and docs_by_table:
+        doc = docs_by_table.get(table)
         if doc:
             # show a trimmed preview to avoid heavy rendering
             preview = {
@@ -316,4 +392,5 @@ with col2:
 st.markdown("---")
 st.write("Operational notes")
 st.write("- Changes update registry.ndjson and registry.db. Keep backups and use git for review.")
+st.write("- Saves append the updated doc to registry.ndjson; the file is rewritten (with a .bak copy) once superseded lines make up more than half of its lines.")
 st.write("- The app inserts simple tokens into alias_index and column_index to improve rule matching.")
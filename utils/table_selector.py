@@ -5,13 +5,51 @@ This module provides classes to load and query the generated registry files
 (schema.json, registry.ndjson, registry.db) for use with LangChain agents.
 """
 import json
+import mmap
+import os
 import sqlite3
-from typing import List, Dict, Tuple, Optional
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, List, Dict, Tuple, Optional
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    # orjson is optional; fall back to the stdlib decoder
+    _loads = json.loads
+
+
+def iter_ndjson(path: str) -> Iterator[bytes]:
+    """
+    Yield the non-blank lines of an NDJSON file as bytes, without trailing newlines.
+    
+    The file is memory-mapped and lines are sliced out of the map, so it is never
+    read into a Python buffer as a whole. Decoding is left to the caller.
+    """
+    with open(path, 'rb') as f:
+        # empty files cannot be mapped
+        if not os.fstat(f.fileno()).st_size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start, end = 0, len(mm)
+            while start < end:
+                nl = mm.find(b"\n", start)
+                if nl == -1:
+                    nl = end
+                line, start = mm[start:nl], nl + 1
+                # skip blank lines without stripping every line
+                if line:
+                    yield line
 
 
 class TableRegistry:
     """Loads and queries the generated registry files."""
     
+    # most token lookups kept in memory; the least recently used are evicted first
+    LOOKUP_CACHE_SIZE = 4096
+    
     def __init__(self, ndjson_path: str, db_path: str, schema_path: Optional[str] = None):
         """
         Initialize the registry loader.
@@ -23,19 +61,30 @@ class TableRegistry:
         """
         self.ndjson_path = ndjson_path
         self.db_path = db_path
+        # (index table, normalized token, limit) -> result rows, in LRU order; see clear_cache()
+        self._lookup_cache = OrderedDict()
+        self._lookup_lock = threading.Lock()
         self.schema = {}
         if schema_path:
             with open(schema_path, 'r', encoding='utf8') as f:
                 self.schema = json.load(f)
         self._load_registry()
+        # one connection reused by every lookup; closed by close(). Opened last so a failed
+        # load leaks nothing, and with mode=rw so a wrong path raises instead of creating
+        # an empty db. Journal mode is left to the scripts that write registry.db.
+        self.conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=rw", uri=True,
+                                    check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-20000")
     
     def _load_registry(self):
         """Load registry from NDJSON file."""
         self.tables = {}
-        with open(self.ndjson_path, 'r', encoding='utf8') as f:
-            for line in f:
-                doc = json.loads(line)
-                self.tables[doc['table']] = doc
+        # modification time of the loaded file, for spotting a stale registry when debugging
+        self.mtime = os.path.getmtime(self.ndjson_path)
+        for line in iter_ndjson(self.ndjson_path):
+            doc = _loads(line)
+            self.tables[doc['table']] = doc
     
     def find_tables_by_token(self, token: str, limit: int = 5) -> List[Dict]:
         """
@@ -48,15 +97,17 @@ class TableRegistry:
         Returns:
             List of table document dictionaries
         """
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
         normalized = token.lower().replace(' ', '_')
-        cur.execute(
-            "SELECT DISTINCT table_name FROM alias_index WHERE token = ? LIMIT ?",
-            (normalized, limit)
-        )
-        results = cur.fetchall()
-        conn.close()
+        key = ("alias_index", normalized, limit)
+        results = self._cache_get(key)
+        if results is None:
+            cur = self.conn.cursor()
+            cur.execute(
+                "SELECT DISTINCT table_name FROM alias_index WHERE token = ? LIMIT ?",
+                (normalized, limit)
+            )
+            results = cur.fetchall()
+            self._cache_put(key, results)
         table_names = [r[0] for r in results]
         return [self.tables.get(t) for t in table_names if t in self.tables]
     
@@ -71,20 +122,98 @@ class TableRegistry:
         Returns:
             List of (table_name, column_name) tuples
         """
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
         normalized = token.lower().replace(' ', '_')
-        cur.execute(
-            "SELECT DISTINCT table_name, column_name FROM column_index WHERE token = ? LIMIT ?",
-            (normalized, limit)
-        )
-        results = cur.fetchall()
-        conn.close()
-        return results
+        key = ("column_index", normalized, limit)
+        results = self._cache_get(key)
+        if results is None:
+            cur = self.conn.cursor()
+            cur.execute(
+                "SELECT DISTINCT table_name, column_name FROM column_index WHERE token = ? LIMIT ?",
+                (normalized, limit)
+            )
+            results = cur.fetchall()
+            self._cache_put(key, results)
+        return list(results)
+    
+    def _lookup_tokens(self, index: str, columns: str, tokens: List[str], limit: int) -> Dict[str, List[Tuple]]:
+        """
+        Select `columns` from the `index` table for all tokens, querying only the
+        tokens that are not cached yet, on one cursor.
+        
+        Returns:
+            Dict of normalized token -> first `limit` rows
+        """
+        normalized = list(dict.fromkeys(t.lower().replace(' ', '_') for t in tokens))
+        found = {}
+        cur = None
+        for t in normalized:
+            rows = self._cache_get((index, t, limit))
+            if rows is None:
+                if cur is None:
+                    cur = self.conn.cursor()
+                # one LIMIT query per token: SQLite stops after `limit` rows, which a
+                # single IN (...) query cannot do per token for common tokens
+                cur.execute(f"SELECT DISTINCT {columns} FROM {index} WHERE token = ? LIMIT ?", (t, limit))
+                rows = cur.fetchall()
+                self._cache_put((index, t, limit), rows)
+            found[t] = rows
+        return found
+
+    def _cache_get(self, key: Tuple) -> Optional[List[Tuple]]:
+        """Return cached rows for key (marking them recently used), or None."""
+        with self._lookup_lock:
+            rows = self._lookup_cache.get(key)
+            if rows is not None:
+                self._lookup_cache.move_to_end(key)
+            return rows
+    
+    def _cache_put(self, key: Tuple, rows: List[Tuple]):
+        """Cache rows for key, evicting the least recently used entry past LOOKUP_CACHE_SIZE."""
+        with self._lookup_lock:
+            self._lookup_cache[key] = rows
+            self._lookup_cache.move_to_end(key)
+            if len(self._lookup_cache) > self.LOOKUP_CACHE_SIZE:
+                self._lookup_cache.popitem(last=False)
+    
+    def find_tables_by_tokens(self, tokens: List[str], limit: int = 5) -> Dict[str, List[Dict]]:
+        """
+        Find tables for several tokens in one call.
+        
+        Args:
+            tokens: Search tokens (will be normalized)
+            limit: Maximum number of results per token
+            
+        Returns:
+            Dict of token -> list of table document dictionaries
+        """
+        found = self._lookup_tokens("alias_index", "table_name", tokens, limit)
+        return {
+            t: [self.tables.get(r[0]) for r in found[t.lower().replace(' ', '_')] if r[0] in self.tables]
+            for t in tokens
+        }
+    
+    def find_columns_by_tokens(self, tokens: List[str], limit: int = 10) -> Dict[str, List[Tuple[str, str]]]:
+        """
+        Find (table, column) pairs for several tokens in one call.
+        
+        Args:
+            tokens: Search tokens (will be normalized)
+            limit: Maximum number of results per token
+            
+        Returns:
+            Dict of token -> list of (table_name, column_name) tuples
+        """
+        found = self._lookup_tokens("column_index", "table_name, column_name", tokens, limit)
+        return {t: list(found[t.lower().replace(' ', '_')]) for t in tokens}
+    
+    def clear_cache(self):
+        """Forget cached token lookups; call after registry.db has been updated."""
+        with self._lookup_lock:
+            self._lookup_cache.clear()
     
     def close(self):
         """Close any open connections."""
-        pass
+        self.conn.close()
 
 
 class TableSelectorTool:
@@ -112,12 +241,10 @@ class TableSelectorTool:
         # Simple token extraction (in production, use NLP)
         tokens = query.lower().split()
         results = []
+        tables_by_token = self.registry.find_tables_by_tokens(tokens, limit=3)
         
         for token in tokens:
-            tables = self.registry.find_tables_by_token(token, limit=3)
-            columns = self.registry.find_columns_by_token(token, limit=5)
-            
-            for table in tables:
+            for table in tables_by_token[token]:
                 if table:
                     results.append({
                         'table': table['table'],
@@ -160,10 +287,10 @@ class SchemaAwareTool:
         """
         tokens = query.lower().split()
         results = []
+        tables_by_token = self.registry.find_tables_by_tokens(tokens, limit=3)
         
         for token in tokens:
-            tables = self.registry.find_tables_by_token(token, limit=3)
-            for table_doc in tables:
+            for table_doc in tables_by_token[token]:
                 if table_doc:
                     table_name = table_doc['table']
                     # Get full column list from schema